@@ -13,73 +13,230 @@ output.csv : 대표 색상 추가된 결과
 import sys
 import os
 import hashlib
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import pandas as pd
 from PIL import Image
-from io import BytesIO
 import numpy as np
-from sklearn.cluster import KMeans
 from tqdm import tqdm
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    # pyarrow 미설치 시 pandas 기본 CSV 엔진 사용
+    pa = None
+
 CACHE_DIR = ".image_cache"
+# 대표 색상 캐시 버전: 같은 이미지에 대한 결과가 바뀌는 알고리즘/파라미터 변경 시 증가
+COLOR_CACHE_VERSION = 1
+# 추출 방식과 버전별로 대표 색상 캐시를 구분하기 위한 확장자
+COLOR_CACHE_EXT = f".mediancut.v{COLOR_CACHE_VERSION}.hex"
+# 다운로드와 색상 계산을 함께 수행하는 워커 스레드 수
+MAX_WORKERS = 16
+# 동시 HTTP 요청 수
+MAX_DOWNLOADS = 8
+# 색상 계산 전 축소할 목표 크기
+RESIZE_SIZE = (120, 120)
+# 원본 면적이 목표 크기의 이 배수 이하이면 리샘플링 생략
+RESAMPLE_AREA_RATIO = 4
+# 디코딩/축소된 픽셀 배열 캐시 확장자
+# 전처리 파라미터가 바뀌면 다른 파일을 사용하도록 배경 처리/목표 크기/리샘플링 기준을 포함
+PIXEL_CACHE_EXT = f".rgb.{RESIZE_SIZE[0]}x{RESIZE_SIZE[1]}.r{RESAMPLE_AREA_RATIO}.npy"
+# 대표 색상 계산에 사용할 최대 픽셀 수
+MAX_SAMPLE_PIXELS = 5000
+
+def make_session() -> requests.Session:
+    """keep-alive 커넥션 풀과 재시도가 설정된 세션 생성."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.2),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# 스레드 간 커넥션 풀 재사용을 위해 세션 공유 (같은 호스트의 TLS 핸드셰이크 생략)
+SESSION = make_session()
+# 동시 HTTP 요청 수 제한
+DOWNLOAD_SEMAPHORE = threading.Semaphore(MAX_DOWNLOADS)
 
 def ensure_cache():
-    if not os.path.isdir(CACHE_DIR):
-        os.makedirs(CACHE_DIR)
+    # 여러 스레드가 동시에 호출해도 안전하도록 exist_ok 사용
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+def url_hash(url: str) -> str:
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest()
 
 def filename_for_url(url: str) -> str:
-    h = hashlib.sha256(url.encode("utf-8")).hexdigest()
-    return os.path.join(CACHE_DIR, h + ".img")
+    return os.path.join(CACHE_DIR, url_hash(url) + ".img")
+
+def color_filename_for_url(url: str) -> str:
+    return os.path.join(CACHE_DIR, url_hash(url) + COLOR_CACHE_EXT)
 
-def download_image(url: str) -> Image.Image:
-    """다운로드 후 캐시에 저장/재사용."""
+def read_cached_color(color_path: str):
+    """캐시된 대표 색상 HEX 반환. 없거나 비어 있으면(중단된 기록) None."""
+    try:
+        with open(color_path) as f:
+            color = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return color or None
+
+def write_cached_color(color_path: str, color: str):
+    """대표 색상을 tmp 파일에 기록한 뒤 교체하여 불완전한 캐시 파일이 남지 않도록 저장."""
+    tmp_path = f"{color_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(color)
+        os.replace(tmp_path, color_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def download_image(url: str) -> str:
+    """다운로드 후 캐시에 저장/재사용. 캐시 파일 경로 반환."""
     ensure_cache()
     path = filename_for_url(url)
     if not os.path.exists(path):
-        resp = requests.get(url, timeout=30)
-        resp.raise_for_status()
-        with open(path, "wb") as f:
-            f.write(resp.content)
-    with open(path, "rb") as f:
-        img = Image.open(BytesIO(f.read()))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with DOWNLOAD_SEMAPHORE, SESSION.get(url, stream=True, timeout=30) as resp:
+                resp.raise_for_status()
+                # 응답 본문을 메모리에 올리지 않고 청크 단위로 기록
+                # (Content-Encoding(gzip 등)은 풀어서 이미지 바이트로 저장)
+                resp.raw.decode_content = True
+                with open(tmp_path, "wb") as f:
+                    shutil.copyfileobj(resp.raw, f, length=64 * 1024)
+            # 다운로드 도중 실패해도 불완전한 파일이 캐시에 남지 않도록 완료 후 교체
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return path
+
+def decode_and_resize(path: str, size=RESIZE_SIZE) -> Image.Image:
+    """캐시 파일을 디코딩하고 큰 이미지는 연산량 절감을 위해 축소."""
+    # 로컬 파일은 Pillow가 직접 열어 읽음 (bytes/BytesIO 복사 없음)
+    with Image.open(path) as img:
+        # JPEG는 디코딩(IDCT) 단계에서 바로 축소
+        img.draft("RGB", size)
         # GIF 등 팔레트 이미지를 일관되게 처리하기 위해 RGB 변환
         img = img.convert("RGB")
+    # 이미 충분히 작은 이미지는 리샘플링 없이 픽셀 샘플링만 사용
+    if img.width * img.height > RESAMPLE_AREA_RATIO * size[0] * size[1]:
+        img.thumbnail(size, Image.Resampling.BILINEAR)
     return img
 
-def dominant_color(img: Image.Image, k=4, resize=(120, 120)) -> str:
-    """K-Means 기반 대표 색상 HEX 반환."""
-    # 연산량 절감을 위해 리사이즈
-    img_small = img.resize(resize)
-    arr = np.asarray(img_small, dtype=np.uint8)
-    pixels = arr.reshape(-1, 3)
+def load_pixels(path: str) -> np.ndarray:
+    """디코딩/축소된 (H, W, 3) uint8 배열 반환. 캐시 파일 옆 .npy에 저장/재사용."""
+    npy_path = path + PIXEL_CACHE_EXT
+    if os.path.exists(npy_path):
+        return np.load(npy_path, mmap_mode="r")
+    arr = np.asarray(decode_and_resize(path), dtype=np.uint8)
+    tmp_path = f"{npy_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp_path, npy_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return arr
+
+def sample_pixels(pixels, n=MAX_SAMPLE_PIXELS):
+    """픽셀이 n개보다 많으면 무작위로 n개 샘플링 (재현성을 위해 고정 시드)"""
+    if len(pixels) <= n:
+        return pixels
+    rng = np.random.default_rng(0)
+    idx = rng.choice(len(pixels), size=n, replace=False)
+    return pixels[idx]
+
+def dominant_color(arr: np.ndarray, k=4) -> str:
+    """메디안 컷 기반 대표 색상 HEX 반환."""
+    pixels = sample_pixels(arr.reshape(-1, 3))
 
     # 완전한 검정/흰색이 너무 많으면 배경일 수 있으므로 약간 샘플 필터링 (선택사항)
     # 여기서는 간단히 그대로 사용
-    kmeans = KMeans(n_clusters=k, n_init="auto", random_state=0)
-    labels = kmeans.fit_predict(pixels)
-    # 가장 큰 클러스터 선택
-    _, counts = np.unique(labels, return_counts=True)
-    dominant_idx = counts.argmax()
-    color = kmeans.cluster_centers_[dominant_idx]
-    r, g, b = [int(round(c)) for c in color]
+    # Pillow 내장 메디안 컷으로 k색 팔레트 생성 (반복 수렴이 필요한 K-Means 대비 단일 분할)
+    img = Image.fromarray(np.ascontiguousarray(pixels).reshape(-1, 1, 3))
+    pal_img = img.quantize(colors=k, method=Image.Quantize.MEDIANCUT)
+    # 가장 많은 픽셀이 속한 팔레트 색상 선택
+    counts = np.bincount(np.asarray(pal_img).ravel())
+    palette = np.array(pal_img.getpalette()[:len(counts) * 3]).reshape(-1, 3)
+    r, g, b = palette[counts.argmax()]
     return f"#{r:02x}{g:02x}{b:02x}"
 
+def cluster_image(path: str) -> str:
+    """캐시된 이미지 파일에서 대표 색상 HEX 반환 (디코딩 또는 .npy 캐시 로드)."""
+    return dominant_color(load_pixels(path))
+
+def process_one(url: str) -> str:
+    """URL 하나의 대표 색상 HEX 반환 (워커 스레드에서 실행). 결과를 캐시에 저장/재사용."""
+    ensure_cache()
+    color_path = color_filename_for_url(url)
+    color = read_cached_color(color_path)
+    if color is not None:
+        return color
+    path = download_image(url)
+    color = cluster_image(path)
+    write_cached_color(color_path, color)
+    return color
+
+def read_csv(path: str) -> pd.DataFrame:
+    """CSV 로드 (pyarrow가 설치되어 있으면 C++ 멀티스레드 파서 사용)."""
+    if pa is not None:
+        return pd.read_csv(path, engine="pyarrow")
+    return pd.read_csv(path)
+
+def write_csv(df: pd.DataFrame, path: str):
+    """CSV 저장. pandas와 출력이 같은 경우(모든 열이 문자열)에만 pyarrow C++ writer 사용."""
+    # 따옴표가 필요한 헤더나 (빈 값이 ""로 기록되는) 단일 열은 pandas writer 사용
+    if (pa is not None and len(df.columns) > 1
+            and not any(any(c in str(col) for c in ',"\r\n') for col in df.columns)):
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            # 숫자/날짜 열은 pandas와 포맷이 달라지므로(예: 1.0 → 1) 문자열 열만 허용
+            if all(pa.types.is_string(t) or pa.types.is_large_string(t) or pa.types.is_null(t)
+                   for t in table.schema.types):
+                with open(path, "wb") as f:
+                    f.write((",".join(map(str, df.columns)) + "\n").encode("utf-8"))
+                    options = pa_csv.WriteOptions(include_header=False, quoting_style="none")
+                    pa_csv.write_csv(table, f, options)
+                return
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # 따옴표 처리가 필요한 값이 있거나 변환할 수 없는 열이 있으면 pandas writer로 대체
+            pass
+    df.to_csv(path, index=False)
+
 def main(input_path: str, output_path: str):
-    df = pd.read_csv(input_path)
+    df = read_csv(input_path)
     # 고유 URL만 처리
     unique_urls = df["image_url"].dropna().unique()
 
     url_to_color = {}
-    for url in tqdm(unique_urls, desc="Processing images"):
-        try:
-            img = download_image(url)
-            url_to_color[url] = dominant_color(img)
-        except Exception as e:
-            print(f"[WARN] {url} 처리 실패: {e}")
-            url_to_color[url] = None
+    # 다운로드(I/O)와 색상 계산(CPU)이 URL 단위로 겹치도록 병렬 처리
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = {ex.submit(process_one, url): url for url in unique_urls}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing images"):
+            url = futures[future]
+            try:
+                url_to_color[url] = future.result()
+            except Exception as e:
+                print(f"[WARN] {url} 처리 실패: {e}")
+                url_to_color[url] = None
 
     df["dominant_color"] = df["image_url"].map(url_to_color)
-    df.to_csv(output_path, index=False)
+    write_csv(df, output_path)
     print(f"완료! 결과 저장: {output_path}")
 
 if __name__ == "__main__":
@@ -15,131 +15,339 @@ Usage:
 import sys
 import os
 import hashlib
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import pandas as pd
 from PIL import Image
-from io import BytesIO
 import numpy as np
 from sklearn.cluster import KMeans
+from threadpoolctl import threadpool_limits
 from tqdm import tqdm
-import colorsys
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    # pyarrow 미설치 시 pandas 기본 CSV 엔진 사용
+    pa = None
+
+try:
+    from cuml.cluster import KMeans as CuKMeans
+    import cupy as cp
+    # 패키지가 설치되어 있어도 사용할 수 있는 CUDA 장치가 없으면 CPU 백엔드 사용
+    if cp.cuda.runtime.getDeviceCount() == 0:
+        CuKMeans = None
+except Exception:
+    # cuML(CUDA) 미설치 또는 드라이버/장치 확인 실패 시 CPU 백엔드 사용
+    CuKMeans = None
+
+try:
+    import faiss
+except ImportError:
+    # faiss 미설치 시 scikit-learn KMeans 사용
+    faiss = None
 
 CACHE_DIR = ".image_cache"
+# 대표 색상 캐시 버전: 같은 이미지에 대한 결과가 바뀌는 알고리즘/파라미터 변경 시 증가
+COLOR_CACHE_VERSION = 2
+# K-Means 학습 백엔드 (백엔드마다 초기화가 달라 결과 색상이 조금씩 다를 수 있음)
+KMEANS_BACKEND = "cuml" if CuKMeans is not None else "faiss" if faiss is not None else "sklearn"
+# 추출 방식/백엔드/버전별로 대표 색상 캐시를 구분하기 위한 확장자
+COLOR_CACHE_EXT = f".improved.{KMEANS_BACKEND}.v{COLOR_CACHE_VERSION}.hex"
+# 다운로드와 클러스터링을 함께 수행하는 워커 스레드 수
+MAX_WORKERS = 16
+# 동시 HTTP 요청 수
+MAX_DOWNLOADS = 8
+# 색상 계산 전 축소할 목표 크기
+RESIZE_SIZE = (150, 150)
+# 원본 면적이 목표 크기의 이 배수 이하이면 리샘플링 생략
+RESAMPLE_AREA_RATIO = 4
+# 디코딩/축소된 픽셀 배열 캐시 확장자 (흰색 배경 합성 방식이 같은 추출기끼리 공유)
+# 전처리 파라미터가 바뀌면 다른 파일을 사용하도록 배경 처리/목표 크기/리샘플링 기준을 포함
+PIXEL_CACHE_EXT = f".white.{RESIZE_SIZE[0]}x{RESIZE_SIZE[1]}.r{RESAMPLE_AREA_RATIO}.npy"
+# 클러스터링에 사용할 최대 픽셀 수
+MAX_SAMPLE_PIXELS = 5000
+
+def make_session() -> requests.Session:
+    """keep-alive 커넥션 풀과 재시도가 설정된 세션 생성."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.2),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# 스레드 간 커넥션 풀 재사용을 위해 세션 공유 (같은 호스트의 TLS 핸드셰이크 생략)
+SESSION = make_session()
+# 동시 HTTP 요청 수 제한
+DOWNLOAD_SEMAPHORE = threading.Semaphore(MAX_DOWNLOADS)
 
 def ensure_cache():
-    if not os.path.isdir(CACHE_DIR):
-        os.makedirs(CACHE_DIR)
+    # 여러 스레드가 동시에 호출해도 안전하도록 exist_ok 사용
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+def url_hash(url: str) -> str:
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest()
 
 def filename_for_url(url: str) -> str:
-    h = hashlib.sha256(url.encode("utf-8")).hexdigest()
-    return os.path.join(CACHE_DIR, h + ".img")
+    return os.path.join(CACHE_DIR, url_hash(url) + ".img")
+
+def color_filename_for_url(url: str) -> str:
+    return os.path.join(CACHE_DIR, url_hash(url) + COLOR_CACHE_EXT)
+
+def read_cached_color(color_path: str):
+    """캐시된 대표 색상 HEX 반환. 없거나 비어 있으면(중단된 기록) None."""
+    try:
+        with open(color_path) as f:
+            color = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return color or None
 
-def download_image(url: str) -> Image.Image:
-    """다운로드 후 캐시에 저장/재사용."""
+def write_cached_color(color_path: str, color: str):
+    """대표 색상을 tmp 파일에 기록한 뒤 교체하여 불완전한 캐시 파일이 남지 않도록 저장."""
+    tmp_path = f"{color_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(color)
+        os.replace(tmp_path, color_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def download_image(url: str) -> str:
+    """다운로드 후 캐시에 저장/재사용. 캐시 파일 경로 반환."""
     ensure_cache()
     path = filename_for_url(url)
     if not os.path.exists(path):
-        resp = requests.get(url, timeout=30)
-        resp.raise_for_status()
-        with open(path, "wb") as f:
-            f.write(resp.content)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with DOWNLOAD_SEMAPHORE, SESSION.get(url, stream=True, timeout=30) as resp:
+                resp.raise_for_status()
+                # 응답 본문을 메모리에 올리지 않고 청크 단위로 기록
+                # (Content-Encoding(gzip 등)은 풀어서 이미지 바이트로 저장)
+                resp.raw.decode_content = True
+                with open(tmp_path, "wb") as f:
+                    shutil.copyfileobj(resp.raw, f, length=64 * 1024)
+            # 다운로드 도중 실패해도 불완전한 파일이 캐시에 남지 않도록 완료 후 교체
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return path
+
+def decode_and_resize(path: str, size=RESIZE_SIZE) -> Image.Image:
+    """캐시 파일을 디코딩하고 큰 이미지는 연산량 절감을 위해 축소."""
+    # 로컬 파일은 Pillow가 직접 열어 읽음 (bytes/BytesIO 복사 없음)
+    with Image.open(path) as img:
+        # JPEG는 디코딩(IDCT) 단계에서 바로 축소
+        img.draft("RGB", size)
+        img.load()
+        # 이미 충분히 작은 이미지는 리샘플링 없이 픽셀 샘플링만 사용
+        if img.width * img.height > RESAMPLE_AREA_RATIO * size[0] * size[1]:
+            img.thumbnail(size, Image.Resampling.BILINEAR)
     
-    with open(path, "rb") as f:
-        img = Image.open(BytesIO(f.read()))
-        
-        # RGBA 이미지의 경우 투명 영역을 흰색 배경과 합성
-        if img.mode == 'RGBA':
-            # 흰색 배경 생성
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            # 알파 채널을 마스크로 사용하여 합성
-            background.paste(img, mask=img.split()[-1])
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
+    # RGBA 이미지의 경우 투명 영역을 흰색 배경과 합성
+    if img.mode == 'RGBA':
+        # 흰색 배경 생성
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        # 알파 채널을 마스크로 사용하여 합성
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
             
     return img
 
-def rgb_to_hsv(r, g, b):
-    """RGB를 HSV로 변환"""
-    return colorsys.rgb_to_hsv(r/255.0, g/255.0, b/255.0)
-
-def is_extreme_color(r, g, b, threshold=20):
-    """극단적인 색상(너무 어둡거나 밝은 색상) 판별"""
+def extreme_color_mask(pixels, threshold=20):
+    """극단적인 색상(너무 어둡거나 밝은 색상) 픽셀 마스크 반환"""
     # 너무 어두운 색상
-    if r < threshold and g < threshold and b < threshold:
-        return True
-    # 너무 밝은 색상  
-    if r > (255-threshold) and g > (255-threshold) and b > (255-threshold):
-        return True
-    return False
-
-def get_color_saturation(r, g, b):
-    """색상의 채도 계산"""
-    h, s, v = rgb_to_hsv(r, g, b)
-    return s
-
-def dominant_color(img: Image.Image, k=5, resize=(150, 150)) -> str:
+    dark = (pixels < threshold).all(axis=1)
+    # 너무 밝은 색상
+    bright = (pixels > (255-threshold)).all(axis=1)
+    return dark | bright
+
+def get_color_saturation(colors):
+    """(N, 3) RGB 배열의 채도 계산 (colorsys.rgb_to_hsv 의 S와 동일)"""
+    cmax = colors.max(axis=1)
+    cmin = colors.min(axis=1)
+    return np.where(cmax > 0, (cmax - cmin) / np.maximum(cmax, 1), 0)
+
+def load_pixels(path: str) -> np.ndarray:
+    """디코딩/축소된 (H, W, 3) uint8 배열 반환. 캐시 파일 옆 .npy에 저장/재사용."""
+    npy_path = path + PIXEL_CACHE_EXT
+    if os.path.exists(npy_path):
+        return np.load(npy_path, mmap_mode="r")
+    arr = np.asarray(decode_and_resize(path), dtype=np.uint8)
+    tmp_path = f"{npy_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp_path, npy_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return arr
+
+def sample_pixels(pixels, n=MAX_SAMPLE_PIXELS):
+    """픽셀이 n개보다 많으면 무작위로 n개 샘플링 (재현성을 위해 고정 시드)"""
+    if len(pixels) <= n:
+        return pixels
+    rng = np.random.default_rng(0)
+    idx = rng.choice(len(pixels), size=n, replace=False)
+    return pixels[idx]
+
+def quantize_pixels(pixels, bits=5):
+    """채널당 bits 비트 히스토그램의 빈별 평균 색상(실제 픽셀 평균)과 픽셀 수 반환"""
+    shift = 8 - bits
+    q = (pixels >> shift).astype(np.uint32)
+    keys = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    # 빈 중앙값 대신 빈에 속한 픽셀의 평균을 사용하여 단색 이미지도 원래 색상 그대로 유지
+    colors = np.stack([np.bincount(inverse, weights=pixels[:, c]) for c in range(3)], axis=1)
+    return colors / counts[:, None], counts
+
+def fit_kmeans(features, n_clusters, weights):
+    """가중 K-Means 학습 후 (labels, centers) 반환. cuML > faiss > scikit-learn 순으로 사용."""
+    if n_clusters == 1:
+        # 단색 이미지 등 클러스터가 하나면 학습 없이 가중 평균이 곧 중심
+        center = np.average(features, axis=0, weights=weights)
+        return np.zeros(len(features), dtype=np.intp), center[None, :]
+    if CuKMeans is not None:
+        try:
+            # CUDA 장치에서 학습 (결과는 NumPy 배열로 복사)
+            x = cp.asarray(features, dtype=cp.float32)
+            km = CuKMeans(n_clusters=n_clusters, n_init=1, max_iter=20, random_state=0)
+            km.fit(x, sample_weight=cp.asarray(weights, dtype=cp.float32))
+            return cp.asnumpy(km.labels_), cp.asnumpy(km.cluster_centers_)
+        except (RuntimeError, MemoryError):
+            # CUDA 런타임 오류/GPU 메모리 부족 시 CPU 백엔드로 대체
+            pass
+    if faiss is not None:
+        # faiss는 BLAS/OpenMP 기반 C++ 구현으로 학습
+        x = np.ascontiguousarray(features, dtype=np.float32)
+        # 기본값(센트로이드당 256개)을 넘으면 일부 빈만 무작위로 뽑아 학습하므로 전체 빈을 사용하도록 지정
+        km = faiss.Kmeans(x.shape[1], n_clusters, niter=20, seed=0,
+                          min_points_per_centroid=1, max_points_per_centroid=len(x))
+        km.train(x, weights=np.ascontiguousarray(weights, dtype=np.float32))
+        _, labels = km.index.search(x, 1)
+        return labels.ravel(), km.centroids
+    # 히스토그램 빈은 수백 개 수준이므로 단일 초기화 + Elkan(삼각 부등식 가지치기)으로 충분
+    kmeans = KMeans(n_clusters=n_clusters, n_init=1, init="k-means++", max_iter=20, tol=1e-3,
+                    algorithm="elkan", random_state=0)
+    labels = kmeans.fit_predict(features, sample_weight=weights)
+    return labels, kmeans.cluster_centers_
+
+def dominant_color(arr: np.ndarray, k=5) -> str:
     """개선된 대표 색상 추출 알고리즘"""
-    # 연산량 절감을 위해 리사이즈
-    img_small = img.resize(resize)
-    arr = np.asarray(img_small, dtype=np.uint8)
-    pixels = arr.reshape(-1, 3)
+    pixels = sample_pixels(arr.reshape(-1, 3))
     
     # 극단적인 색상 필터링
-    filtered_pixels = []
-    for pixel in pixels:
-        r, g, b = pixel
-        if not is_extreme_color(r, g, b):
-            filtered_pixels.append(pixel)
+    keep = ~extreme_color_mask(pixels)
     
     # 필터링된 픽셀이 너무 적으면 원본 사용
-    if len(filtered_pixels) < len(pixels) * 0.1:
+    if keep.sum() < len(pixels) * 0.1:
         filtered_pixels = pixels
     else:
-        filtered_pixels = np.array(filtered_pixels)
+        filtered_pixels = pixels[keep]
     
-    # K-Means 클러스터링
-    kmeans = KMeans(n_clusters=min(k, len(filtered_pixels)), n_init="auto", random_state=0)
-    labels = kmeans.fit_predict(filtered_pixels)
+    # 5비트 히스토그램의 고유 빈만 가중치와 함께 클러스터링
+    colors, weights = quantize_pixels(filtered_pixels)
     
-    # 각 클러스터의 크기와 채도 계산
-    cluster_info = []
-    unique_labels, counts = np.unique(labels, return_counts=True)
+    # K-Means 클러스터링
+    labels, centers = fit_kmeans(colors, min(k, len(colors)), weights)
     
-    for i, (label, count) in enumerate(zip(unique_labels, counts)):
-        color = kmeans.cluster_centers_[label]
-        r, g, b = [int(round(c)) for c in color]
-        saturation = get_color_saturation(r, g, b)
-        
-        cluster_info.append({
-            'color': (r, g, b),
-            'count': count,
-            'saturation': saturation,
-            'score': count * (1 + saturation * 2)  # 크기 + 채도 가중치
-        })
+    # 각 클러스터의 크기(픽셀 수)와 채도를 한 번에 계산
+    counts = np.bincount(labels, weights=weights, minlength=len(centers))
+    cluster_colors = np.rint(centers).astype(int)
+    saturation = get_color_saturation(cluster_colors)
+    scores = counts * (1 + saturation * 2)  # 크기 + 채도 가중치 (빈 클러스터는 0점)
     
     # 점수가 가장 높은 색상 선택
-    best_cluster = max(cluster_info, key=lambda x: x['score'])
-    r, g, b = best_cluster['color']
+    r, g, b = cluster_colors[scores.argmax()]
     
     return f"#{r:02x}{g:02x}{b:02x}"
 
+def init_worker():
+    """워커 스레드 초기화: 이미지 단위로 병렬화하므로 OpenMP/BLAS 내부 스레드는 1개만 사용.
+
+    OpenMP 스레드 수는 호출한 스레드에만 적용되므로 각 워커 스레드에서 설정.
+    """
+    threadpool_limits(limits=1)
+    if faiss is not None:
+        faiss.omp_set_num_threads(1)
+
+def cluster_image(path: str) -> str:
+    """캐시된 이미지 파일에서 대표 색상 HEX 반환 (디코딩 또는 .npy 캐시 로드)."""
+    return dominant_color(load_pixels(path))
+
+def process_one(url: str) -> str:
+    """URL 하나의 대표 색상 HEX 반환 (워커 스레드에서 실행). 결과를 캐시에 저장/재사용."""
+    ensure_cache()
+    color_path = color_filename_for_url(url)
+    color = read_cached_color(color_path)
+    if color is not None:
+        return color
+    path = download_image(url)
+    color = cluster_image(path)
+    write_cached_color(color_path, color)
+    return color
+
+def read_csv(path: str) -> pd.DataFrame:
+    """CSV 로드 (pyarrow가 설치되어 있으면 C++ 멀티스레드 파서 사용)."""
+    if pa is not None:
+        return pd.read_csv(path, engine="pyarrow")
+    return pd.read_csv(path)
+
+def write_csv(df: pd.DataFrame, path: str):
+    """CSV 저장. pandas와 출력이 같은 경우(모든 열이 문자열)에만 pyarrow C++ writer 사용."""
+    # 따옴표가 필요한 헤더나 (빈 값이 ""로 기록되는) 단일 열은 pandas writer 사용
+    if (pa is not None and len(df.columns) > 1
+            and not any(any(c in str(col) for c in ',"\r\n') for col in df.columns)):
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            # 숫자/날짜 열은 pandas와 포맷이 달라지므로(예: 1.0 → 1) 문자열 열만 허용
+            if all(pa.types.is_string(t) or pa.types.is_large_string(t) or pa.types.is_null(t)
+                   for t in table.schema.types):
+                with open(path, "wb") as f:
+                    f.write((",".join(map(str, df.columns)) + "\n").encode("utf-8"))
+                    options = pa_csv.WriteOptions(include_header=False, quoting_style="none")
+                    pa_csv.write_csv(table, f, options)
+                return
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # 따옴표 처리가 필요한 값이 있거나 변환할 수 없는 열이 있으면 pandas writer로 대체
+            pass
+    df.to_csv(path, index=False)
+
 def main(input_path: str, output_path: str):
-    df = pd.read_csv(input_path)
+    df = read_csv(input_path)
     # 고유 URL만 처리
     unique_urls = df["image_url"].dropna().unique()
 
     url_to_color = {}
-    for url in tqdm(unique_urls, desc="Processing images"):
-        try:
-            img = download_image(url)
-            url_to_color[url] = dominant_color(img)
-        except Exception as e:
-            print(f"[WARN] {url} 처리 실패: {e}")
-            url_to_color[url] = None
+    # 다운로드(I/O)와 클러스터링(CPU)이 URL 단위로 겹치도록 병렬 처리
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS, initializer=init_worker) as ex:
+        futures = {ex.submit(process_one, url): url for url in unique_urls}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing images"):
+            url = futures[future]
+            try:
+                url_to_color[url] = future.result()
+            except Exception as e:
+                print(f"[WARN] {url} 처리 실패: {e}")
+                url_to_color[url] = None
 
     df["dominant_color"] = df["image_url"].map(url_to_color)
-    df.to_csv(output_path, index=False)
+    write_csv(df, output_path)
     print(f"완료! 결과 저장: {output_path}")
 
 if __name__ == "__main__":
@@ -10,18 +10,19 @@ import sys
 import json
 import pandas as pd
 
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    # pyarrow 미설치 시 pandas 기본 CSV 엔진 사용
+    CSV_ENGINE = 'c'
+
 def generate_html(csv_file, output_file):
-    # CSV 데이터 로드
-    df = pd.read_csv(csv_file)
+    # CSV 데이터 로드 (pyarrow가 설치되어 있으면 C++ 파서 사용)
+    df = pd.read_csv(csv_file, engine=CSV_ENGINE)
     
     # JavaScript 배열로 변환
-    crop_data = []
-    for _, row in df.iterrows():
-        crop_data.append({
-            'crop_name': row['crop_name'],
-            'image_url': row['image_url'], 
-            'dominant_color': row['dominant_color']
-        })
+    crop_data = df[['crop_name', 'image_url', 'dominant_color']].to_dict(orient='records')
     
     # JSON 문자열로 변환
     crop_data_json = json.dumps(crop_data, ensure_ascii=False, indent=8)